@@ -6,9 +6,9 @@ Provides convenient commands for database operations
 
 import sys
 import argparse
-from sqlalchemy import create_engine, inspect
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime, timedelta
+from sqlalchemy import create_engine, inspect, select, delete, func
+from sqlalchemy.orm import sessionmaker, joinedload, raiseload
+from datetime import datetime, timedelta, timezone
 from tabulate import tabulate
 
 from main import Base, Restaurant, Table, Reservation
@@ -18,12 +18,13 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 class DinoManager:
-    """Database management commands"""
+    """Database management commands (use as a context manager)"""
     
-    def __init__(self):
+    def __enter__(self):
         self.db = SessionLocal()
+        return self
     
-    def __del__(self):
+    def __exit__(self, *exc_info):
         self.db.close()
     
     def show_stats(self):
@@ -31,29 +32,26 @@ class DinoManager:
         print("\n🦕 DINO RESERVE DATABASE STATISTICS 🦖\n")
         print("="*60)
         
-        # Count records
-        restaurant_count = self.db.query(Restaurant).count()
-        table_count = self.db.query(Table).count()
-        reservation_count = self.db.query(Reservation).count()
-        
-        # Active vs cancelled reservations
-        active = self.db.query(Reservation).filter(Reservation.status == 'reserved').count()
-        cancelled = self.db.query(Reservation).filter(Reservation.status == 'cancelled').count()
-        
-        # Future reservations
-        now = datetime.now()
-        future = self.db.query(Reservation).filter(
-            Reservation.reservation_time > now,
-            Reservation.status == 'reserved'
-        ).count()
+        # All counts in one round trip (conditional aggregates for the filtered ones)
+        counts = self.db.execute(select(
+            select(func.count(Restaurant.id)).scalar_subquery().label("restaurants"),
+            select(func.count(Table.id)).scalar_subquery().label("tables"),
+            func.count(Reservation.id).label("total"),
+            func.count(Reservation.id).filter(Reservation.status == 'reserved').label("active"),
+            func.count(Reservation.id).filter(Reservation.status == 'cancelled').label("cancelled"),
+            func.count(Reservation.id).filter(
+                Reservation.reservation_time > func.now(),
+                Reservation.status == 'reserved'
+            ).label("future")
+        )).one()
         
         stats = [
-            ["🏢 Restaurants", restaurant_count],
-            ["🪑 Total Tables", table_count],
-            ["📅 Total Reservations", reservation_count],
-            ["✅ Active Reservations", active],
-            ["❌ Cancelled Reservations", cancelled],
-            ["📆 Upcoming Reservations", future],
+            ["🏢 Restaurants", counts.restaurants],
+            ["🪑 Total Tables", counts.tables],
+            ["📅 Total Reservations", counts.total],
+            ["✅ Active Reservations", counts.active],
+            ["❌ Cancelled Reservations", counts.cancelled],
+            ["📆 Upcoming Reservations", counts.future],
         ]
         
         print(tabulate(stats, headers=["Metric", "Count"], tablefmt="fancy_grid"))
@@ -71,7 +69,7 @@ class DinoManager:
             reserved = self.db.query(Table).join(Reservation).filter(
                 Table.restaurant_id == r.id,
                 Reservation.status == 'reserved',
-                Reservation.reservation_time >= datetime.now()
+                Reservation.reservation_time >= func.now()
             ).distinct().count()
             
             data.append([
@@ -101,14 +99,18 @@ class DinoManager:
         
         tables = self.db.query(Table).filter(Table.restaurant_id == restaurant_id).all()
         
+        # Active reservations for every table in one query
+        active = {}
+        for res in self.db.query(Reservation).filter(
+            Reservation.table_id.in_([t.id for t in tables]),
+            Reservation.status == 'reserved',
+            Reservation.reservation_time >= func.now()
+        ).order_by(Reservation.reservation_time):
+            active.setdefault(res.table_id, res)
+        
         data = []
         for t in tables:
-            # Check for active reservation
-            active_res = self.db.query(Reservation).filter(
-                Reservation.table_id == t.id,
-                Reservation.status == 'reserved',
-                Reservation.reservation_time >= datetime.now()
-            ).first()
+            active_res = active.get(t.id)
             
             status = "🍴 Reserved" if active_res else "🦕 Available"
             customer = active_res.customer_name if active_res else "-"
@@ -129,25 +131,36 @@ class DinoManager:
     
     def list_reservations(self, limit: int = 20, status: str = None):
         """List recent reservations"""
-        query = self.db.query(Reservation).join(Table).join(Restaurant)
+        # Single JOIN over just the columns we print, no per-row lazy loads
+        query = select(
+            Reservation.id,
+            Restaurant.name.label("restaurant_name"),
+            Table.table_number,
+            Reservation.customer_name,
+            Reservation.phone,
+            Reservation.party_size,
+            Reservation.reservation_time,
+            Reservation.status
+        ).join(Table, Table.id == Reservation.table_id).join(Restaurant, Restaurant.id == Table.restaurant_id)
         
         if status:
-            query = query.filter(Reservation.status == status)
+            query = query.where(Reservation.status == status)
         
-        reservations = query.order_by(Reservation.reservation_time.desc()).limit(limit).all()
+        reservations = self.db.execute(
+            query.order_by(Reservation.reservation_time.desc()).limit(limit)
+        ).all()
         
         print(f"\n📅 RESERVATIONS (Last {limit}) 📅\n")
         
         data = []
         for r in reservations:
-            restaurant_name = r.table.restaurant.name
             time_str = r.reservation_time.strftime("%Y-%m-%d %H:%M")
             status_icon = "✅" if r.status == 'reserved' else "❌"
             
             data.append([
                 r.id,
-                restaurant_name,
-                f"Table {r.table.table_number}",
+                r.restaurant_name,
+                f"Table {r.table_number}",
                 r.customer_name,
                 r.phone,
                 r.party_size,
@@ -164,10 +177,14 @@ class DinoManager:
     
     def upcoming_reservations(self, days: int = 7):
         """Show upcoming reservations"""
-        now = datetime.now()
+        now = datetime.now(timezone.utc)
         future = now + timedelta(days=days)
         
-        reservations = self.db.query(Reservation).filter(
+        # Load table and restaurant up front; any other lazy load raises
+        reservations = self.db.query(Reservation).options(
+            joinedload(Reservation.table).joinedload(Table.restaurant),
+            raiseload("*")
+        ).filter(
             Reservation.reservation_time.between(now, future),
             Reservation.status == 'reserved'
         ).order_by(Reservation.reservation_time).all()
@@ -182,7 +199,7 @@ class DinoManager:
         for r in reservations:
             restaurant_name = r.table.restaurant.name
             time_str = r.reservation_time.strftime("%Y-%m-%d %H:%M")
-            time_until = r.reservation_time - now
+            time_until = r.reservation_time - datetime.now(r.reservation_time.tzinfo)
             hours = int(time_until.total_seconds() / 3600)
             
             data.append([
@@ -224,14 +241,14 @@ class DinoManager:
     
     def clear_old_reservations(self, days: int = 30):
         """Delete old cancelled reservations"""
-        cutoff = datetime.now() - timedelta(days=days)
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
         
-        old_reservations = self.db.query(Reservation).filter(
+        old_filter = (
             Reservation.reservation_time < cutoff,
             Reservation.status == 'cancelled'
-        ).all()
+        )
         
-        count = len(old_reservations)
+        count = self.db.scalar(select(func.count(Reservation.id)).where(*old_filter))
         
         if count == 0:
             print("✅ No old cancelled reservations to clean up!")
@@ -241,8 +258,7 @@ class DinoManager:
         confirm = input("Delete them? (yes/no): ")
         
         if confirm.lower() in ['yes', 'y']:
-            for res in old_reservations:
-                self.db.delete(res)
+            count = self.db.execute(delete(Reservation).where(*old_filter)).rowcount
             self.db.commit()
             print(f"✅ Deleted {count} old reservations!")
         else:
@@ -299,26 +315,25 @@ Examples:
         parser.print_help()
         return
     
-    manager = DinoManager()
-    
-    try:
-        if args.command == 'stats':
-            manager.show_stats()
-        elif args.command == 'restaurants':
-            manager.list_restaurants()
-        elif args.command == 'tables':
-            manager.list_tables(args.restaurant_id)
-        elif args.command == 'reservations':
-            manager.list_reservations(args.limit, args.status)
-        elif args.command == 'upcoming':
-            manager.upcoming_reservations(args.days)
-        elif args.command == 'cancel':
-            manager.cancel_reservation(args.reservation_id)
-        elif args.command == 'cleanup':
-            manager.clear_old_reservations(args.days)
-    except Exception as e:
-        print(f"\n❌ Error: {e}\n")
-        sys.exit(1)
+    with DinoManager() as manager:
+        try:
+            if args.command == 'stats':
+                manager.show_stats()
+            elif args.command == 'restaurants':
+                manager.list_restaurants()
+            elif args.command == 'tables':
+                manager.list_tables(args.restaurant_id)
+            elif args.command == 'reservations':
+                manager.list_reservations(args.limit, args.status)
+            elif args.command == 'upcoming':
+                manager.upcoming_reservations(args.days)
+            elif args.command == 'cancel':
+                manager.cancel_reservation(args.reservation_id)
+            elif args.command == 'cleanup':
+                manager.clear_old_reservations(args.days)
+        except Exception as e:
+            print(f"\n❌ Error: {e}\n")
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -3,41 +3,69 @@ Unit tests for Dino Reserve API
 Run with: pytest test_main.py -v
 """
 
+import importlib.util
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import List
 
-from main import app, Base, get_db, Restaurant, Table, Reservation
+from main import app, Base, get_db, create_missing_indexes, Restaurant, Table, Reservation
+from factories import ReservationFactory
 
-# Test database (in-memory SQLite)
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Test database (in-memory SQLite). Shared cache lets the sync fixtures and
+# the async API connections see the same database; the StaticPool
+# connection keeps it alive for the whole run.
+SQLALCHEMY_DATABASE_URI = "file:dinotest?mode=memory&cache=shared&uri=true"
+engine = create_engine(
+    f"sqlite:///{SQLALCHEMY_DATABASE_URI}",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+reservation_factory = ReservationFactory(TestingSessionLocal)
+
+# The API talks to the same database through the async driver
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{SQLALCHEMY_DATABASE_URI}", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # Override dependency
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
 
-# Test client
-client = TestClient(app)
+@pytest.fixture(scope="session")
+def client():
+    """One TestClient for the whole run (no `with`, so startup seeding is skipped)"""
+    return TestClient(app)
 
-@pytest.fixture(scope="function", autouse=True)
+@pytest.fixture(scope="session", autouse=True)
 def setup_database():
-    """Create test database before each test and drop after"""
+    """Create the schema once for the whole test run"""
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
 
-@pytest.fixture
-def sample_restaurant():
+def clear_tables():
+    """Empty every table (no DDL between tests)"""
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+@dataclass
+class SampleData:
+    """Ids the tests need, so they don't have to GET them back from the API"""
+    restaurant_id: int
+    table_ids: List[int]
+    capacities: List[int]
+
+def create_sample_data():
     """Create a sample restaurant with tables"""
     db = TestingSessionLocal()
     
@@ -51,39 +79,77 @@ def sample_restaurant():
     db.refresh(restaurant)
     
     # Add 5 test tables
-    for i in range(1, 6):
-        table = Table(
+    tables = [
+        Table(
             restaurant_id=restaurant.id,
             table_number=i,
             capacity=4
         )
-        db.add(table)
+        for i in range(1, 6)
+    ]
+    db.add_all(tables)
     
     db.commit()
     db.close()
     
-    return restaurant
+    return SampleData(
+        restaurant_id=restaurant.id,
+        table_ids=[t.id for t in tables],
+        capacities=[t.capacity for t in tables]
+    )
+
+@pytest.fixture
+def sample_data():
+    """Fresh restaurant for each test"""
+    yield create_sample_data()
+    clear_tables()
+
+@pytest.fixture
+def created_reservation(sample_data):
+    """Fresh restaurant plus one reservation for each test (tests may change it)"""
+    reservation = reservation_factory.create(table_id=sample_data.table_ids[0])
+    
+    return {
+        "restaurant_id": sample_data.restaurant_id,
+        "table_id": reservation.table_id,
+        "id": reservation.id
+    }
 
 class TestHealthCheck:
     """Test API health check"""
     
-    def test_root_endpoint(self):
+    def test_root_endpoint(self, client):
         response = client.get("/")
         assert response.status_code == 200
         data = response.json()
         assert "message" in data
         assert "Dino Reserve" in data["message"]
 
+class TestSchema:
+    """Test startup schema upgrades"""
+    
+    def test_missing_indexes_are_created(self):
+        # A database created before the reservation indexes were added
+        legacy_engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=legacy_engine)
+        with legacy_engine.begin() as conn:
+            for index in Reservation.__table__.indexes:
+                index.drop(conn)
+            create_missing_indexes(conn)
+        
+        names = {index["name"] for index in inspect(legacy_engine).get_indexes("reservations")}
+        assert {index.name for index in Reservation.__table__.indexes} <= names
+
 class TestRestaurants:
     """Test restaurant endpoints"""
     
-    def test_get_restaurants_empty(self):
+    def test_get_restaurants_empty(self, client):
         response = client.get("/restaurants")
         assert response.status_code == 200
         data = response.json()
         assert isinstance(data, list)
     
-    def test_get_restaurants_with_data(self, sample_restaurant):
+    def test_get_restaurants_with_data(self, client, sample_data):
         response = client.get("/restaurants")
         assert response.status_code == 200
         data = response.json()
@@ -91,22 +157,22 @@ class TestRestaurants:
         assert data[0]["name"] == "Test T-Rex Tavern"
         assert data[0]["dino_type"] == "trex"
     
-    def test_get_restaurant_by_id(self, sample_restaurant):
-        response = client.get(f"/restaurants/{sample_restaurant.id}")
+    def test_get_restaurant_by_id(self, client, sample_data):
+        response = client.get(f"/restaurants/{sample_data.restaurant_id}")
         assert response.status_code == 200
         data = response.json()
-        assert data["id"] == sample_restaurant.id
-        assert data["name"] == sample_restaurant.name
+        assert data["id"] == sample_data.restaurant_id
+        assert data["name"] == "Test T-Rex Tavern"
     
-    def test_get_restaurant_not_found(self):
+    def test_get_restaurant_not_found(self, client):
         response = client.get("/restaurants/9999")
         assert response.status_code == 404
 
 class TestTables:
     """Test table endpoints"""
     
-    def test_get_tables_for_restaurant(self, sample_restaurant):
-        response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
+    def test_get_tables_for_restaurant(self, client, sample_data):
+        response = client.get(f"/restaurants/{sample_data.restaurant_id}/tables")
         assert response.status_code == 200
         data = response.json()
         assert len(data) == 5  # We created 5 tables
@@ -118,18 +184,15 @@ class TestTables:
         assert "is_reserved" in table
         assert table["is_reserved"] == False
     
-    def test_get_tables_restaurant_not_found(self):
+    def test_get_tables_restaurant_not_found(self, client):
         response = client.get("/restaurants/9999/tables")
         assert response.status_code == 404
 
 class TestReservations:
     """Test reservation endpoints"""
     
-    def test_create_reservation(self, sample_restaurant):
-        # Get a table
-        tables_response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
-        tables = tables_response.json()
-        table_id = tables[0]["id"]
+    def test_create_reservation(self, client, sample_data):
+        table_id = sample_data.table_ids[0]
         
         # Create reservation
         tomorrow = datetime.now() + timedelta(days=1)
@@ -150,7 +213,7 @@ class TestReservations:
         assert data["party_size"] == 2
         assert data["status"] == "reserved"
     
-    def test_create_reservation_table_not_found(self):
+    def test_create_reservation_table_not_found(self, client):
         tomorrow = datetime.now() + timedelta(days=1)
         reservation_data = {
             "table_id": 9999,
@@ -163,11 +226,9 @@ class TestReservations:
         response = client.post("/reservations", json=reservation_data)
         assert response.status_code == 404
     
-    def test_create_reservation_exceeds_capacity(self, sample_restaurant):
-        tables_response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
-        tables = tables_response.json()
-        table_id = tables[0]["id"]
-        table_capacity = tables[0]["capacity"]
+    def test_create_reservation_exceeds_capacity(self, client, sample_data):
+        table_id = sample_data.table_ids[0]
+        table_capacity = sample_data.capacities[0]
         
         tomorrow = datetime.now() + timedelta(days=1)
         reservation_data = {
@@ -182,151 +243,117 @@ class TestReservations:
         assert response.status_code == 400
         assert "capacity" in response.json()["detail"].lower()
     
-    def test_update_reservation(self, sample_restaurant):
-        # Create a reservation first
-        tables_response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
-        table_id = tables_response.json()[0]["id"]
+    def test_create_reservation_double_booking(self, client, sample_data):
+        table_id = sample_data.table_ids[0]
         
         tomorrow = datetime.now() + timedelta(days=1)
         reservation_data = {
             "table_id": table_id,
-            "customer_name": "Original Name",
+            "customer_name": "Test Customer",
             "phone": "+1-555-TEST",
             "party_size": 2,
             "reservation_time": tomorrow.isoformat()
         }
         
-        create_response = client.post("/reservations", json=reservation_data)
-        reservation_id = create_response.json()["id"]
+        reservation_factory.create(table_id=table_id, reservation_time=tomorrow)
         
-        # Update the reservation
-        update_data = {
-            "customer_name": "Updated Name",
-            "party_size": 3
-        }
+        response = client.post("/reservations", json=reservation_data)
+        assert response.status_code == 400
+        assert "already reserved" in response.json()["detail"]
+    
+    def test_get_all_reservations(self, client, sample_data):
+        reservation_factory.create_batch(*(
+            {"table_id": table_id, "customer_name": f"Customer {i}", "phone": f"+1-555-{i:04d}"}
+            for i, table_id in enumerate(sample_data.table_ids[:3])
+        ))
         
-        response = client.put(f"/reservations/{reservation_id}", json=update_data)
+        response = client.get("/reservations")
         assert response.status_code == 200
-        
         data = response.json()
-        assert data["customer_name"] == "Updated Name"
-        assert data["party_size"] == 3
+        assert sorted(r["customer_name"] for r in data) == ["Customer 0", "Customer 1", "Customer 2"]
     
-    def test_cancel_reservation(self, sample_restaurant):
-        # Create a reservation
-        tables_response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
-        table_id = tables_response.json()[0]["id"]
-        
-        tomorrow = datetime.now() + timedelta(days=1)
-        reservation_data = {
-            "table_id": table_id,
-            "customer_name": "Test Customer",
-            "phone": "+1-555-TEST",
-            "party_size": 2,
-            "reservation_time": tomorrow.isoformat()
-        }
-        
-        create_response = client.post("/reservations", json=reservation_data)
-        reservation_id = create_response.json()["id"]
+    def test_get_reservations_limited(self, client, sample_data):
+        reservation_factory.create_batch(*(
+            {"table_id": table_id, "customer_name": f"Customer {i}"}
+            for i, table_id in enumerate(sample_data.table_ids[:3])
+        ))
         
-        # Cancel the reservation
-        response = client.delete(f"/reservations/{reservation_id}")
+        response = client.get("/reservations?limit=2")
         assert response.status_code == 200
-        assert response.json()["message"] == "Reservation cancelled successfully"
-        
-        # Verify it's cancelled
-        db = TestingSessionLocal()
-        reservation = db.query(Reservation).filter(Reservation.id == reservation_id).first()
-        assert reservation.status == "cancelled"
-        db.close()
+        assert [r["customer_name"] for r in response.json()] == ["Customer 0", "Customer 1"]
     
-    def test_get_all_reservations(self, sample_restaurant):
-        # Create multiple reservations
-        tables_response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
-        tables = tables_response.json()
-        
-        tomorrow = datetime.now() + timedelta(days=1)
-        
-        for i in range(3):
-            reservation_data = {
-                "table_id": tables[i]["id"],
-                "customer_name": f"Customer {i}",
-                "phone": f"+1-555-{i:04d}",
-                "party_size": 2,
-                "reservation_time": tomorrow.isoformat()
-            }
-            client.post("/reservations", json=reservation_data)
+    @pytest.mark.parametrize("status,expected_count", [
+        ("reserved", 2),
+        ("cancelled", 1),
+    ])
+    def test_get_reservations_filtered_by_status(self, client, sample_data, status, expected_count):
+        reservation_factory.create_batch(
+            {"table_id": sample_data.table_ids[0]},
+            {"table_id": sample_data.table_ids[1]},
+            {"table_id": sample_data.table_ids[2], "status": "cancelled"}
+        )
         
-        # Get all reservations
-        response = client.get("/reservations")
+        response = client.get(f"/reservations?status={status}")
         assert response.status_code == 200
         data = response.json()
-        assert len(data) >= 3
+        assert len(data) == expected_count
+        assert all(r["status"] == status for r in data)
     
-    def test_get_reservations_filtered_by_status(self, sample_restaurant):
-        # Create and cancel a reservation
-        tables_response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
-        table_id = tables_response.json()[0]["id"]
-        
-        tomorrow = datetime.now() + timedelta(days=1)
-        reservation_data = {
-            "table_id": table_id,
-            "customer_name": "Test Customer",
-            "phone": "+1-555-TEST",
-            "party_size": 2,
-            "reservation_time": tomorrow.isoformat()
-        }
-        
-        create_response = client.post("/reservations", json=reservation_data)
-        reservation_id = create_response.json()["id"]
-        
-        client.delete(f"/reservations/{reservation_id}")
+    def test_get_reservation_stats(self, client, sample_data):
+        reservation_factory.create_batch(
+            {"table_id": sample_data.table_ids[0]},
+            {"table_id": sample_data.table_ids[1]},
+            {"table_id": sample_data.table_ids[2], "status": "cancelled"}
+        )
         
-        # Get cancelled reservations
-        response = client.get("/reservations?status=cancelled")
+        response = client.get("/reservations/stats")
         assert response.status_code == 200
-        data = response.json()
-        assert all(r["status"] == "cancelled" for r in data)
+        assert response.json() == {"total": 3, "reserved": 2, "cancelled": 1}
+        
+        response = client.get(f"/reservations/stats?restaurant_id={sample_data.restaurant_id + 1}")
+        assert response.json() == {"total": 0, "reserved": 0, "cancelled": 0}
 
-class TestTableStatus:
-    """Test table status with reservations"""
+class TestReservationLifecycle:
+    """Read, update and cancel a single reservation"""
     
-    def test_table_shows_reserved_status(self, sample_restaurant):
-        # Get tables
-        tables_response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
-        tables = tables_response.json()
-        table_id = tables[0]["id"]
-        
-        # Initially not reserved
-        assert tables[0]["is_reserved"] == False
-        
-        # Create reservation
-        tomorrow = datetime.now() + timedelta(days=1)
-        reservation_data = {
-            "table_id": table_id,
-            "customer_name": "Test Customer",
-            "phone": "+1-555-TEST",
-            "party_size": 2,
-            "reservation_time": tomorrow.isoformat()
-        }
-        client.post("/reservations", json=reservation_data)
-        
-        # Check table status again
-        tables_response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
+    def test_table_shows_reserved_status(self, client, created_reservation):
+        tables_response = client.get(f"/restaurants/{created_reservation['restaurant_id']}/tables")
         tables = tables_response.json()
         
-        # Find our table
-        reserved_table = next(t for t in tables if t["id"] == table_id)
+        # Only the booked table is reserved
+        reserved_table = next(t for t in tables if t["id"] == created_reservation["table_id"])
         assert reserved_table["is_reserved"] == True
-        assert reserved_table["current_reservation"] is not None
         assert reserved_table["current_reservation"]["customer_name"] == "Test Customer"
+        assert not any(t["is_reserved"] for t in tables if t["id"] != created_reservation["table_id"])
+    
+    @pytest.mark.parametrize("field,new_value,expected", [
+        ("customer_name", "Updated Name", "Updated Name"),
+        ("party_size", 3, 3),
+        ("phone", "+1-555-0000", "+1-555-0000"),
+    ])
+    def test_update_reservation(self, client, created_reservation, field, new_value, expected):
+        response = client.put(f"/reservations/{created_reservation['id']}", json={field: new_value})
+        assert response.status_code == 200
+        assert response.json()[field] == expected
+    
+    def test_cancel_reservation(self, client, created_reservation):
+        reservation_id = created_reservation["id"]
+        
+        response = client.delete(f"/reservations/{reservation_id}")
+        assert response.status_code == 200
+        assert response.json()["message"] == "Reservation cancelled successfully"
+        
+        # Verify it's cancelled
+        db = TestingSessionLocal()
+        reservation = db.query(Reservation).filter(Reservation.id == reservation_id).first()
+        assert reservation.status == "cancelled"
+        db.close()
 
 class TestDataValidation:
     """Test data validation"""
     
-    def test_create_reservation_missing_fields(self, sample_restaurant):
-        tables_response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
-        table_id = tables_response.json()[0]["id"]
+    def test_create_reservation_missing_fields(self, client, sample_data):
+        table_id = sample_data.table_ids[0]
         
         # Missing customer_name
         reservation_data = {
@@ -339,7 +366,7 @@ class TestDataValidation:
         response = client.post("/reservations", json=reservation_data)
         assert response.status_code == 422  # Validation error
     
-    def test_invalid_restaurant_id(self):
+    def test_invalid_restaurant_id(self, client):
         response = client.get("/restaurants/not-a-number")
         assert response.status_code == 422
 
@@ -347,15 +374,15 @@ class TestDataValidation:
 class TestPerformance:
     """Test API performance"""
     
-    def test_bulk_table_retrieval(self, sample_restaurant):
-        import time
-        
-        start = time.time()
-        response = client.get(f"/restaurants/{sample_restaurant.id}/tables")
-        end = time.time()
+    @pytest.mark.benchmark(group="read")
+    @pytest.mark.skipif(importlib.util.find_spec("pytest_benchmark") is None, reason="needs pytest-benchmark")
+    def test_bulk_table_retrieval(self, client, benchmark, sample_data):
+        response = benchmark(client.get, f"/restaurants/{sample_data.restaurant_id}/tables")
         
         assert response.status_code == 200
-        assert (end - start) < 1.0  # Should complete in under 1 second
+        # Median over many rounds, so one slow round on a busy runner can't fail it
+        if benchmark.stats:
+            assert benchmark.stats.stats.median < 1.0
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
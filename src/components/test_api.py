@@ -3,13 +3,74 @@ API Testing Script for Dino Reserve
 Tests all API endpoints to ensure they're working correctly
 """
 
-import requests
-import json
+import asyncio
+import logging
+import os
+import sys
+import time
+import httpx
+import orjson
+from contextvars import ContextVar
+from functools import lru_cache
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional
+
+try:
+    import h2  # noqa: F401  (httpx[http2])
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
 
 BASE_URL = "http://localhost:8000"
 
+# Everything goes to one host, so a single pool sized for the concurrent
+# fan-out (restaurants x checks) keeps requests from queueing for a socket.
+# No retries: a failed call should fail its check, not be hidden.
+POOL_SIZE = max(16, (os.cpu_count() or 4) * 2)
+_TRANSPORT = httpx.AsyncHTTPTransport(
+    http2=HTTP2,
+    retries=0,
+    limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+)
+
+# One client for the whole run: independent requests overlap on the event
+# loop and share its keep-alive (or HTTP/2) connections
+CLIENT = httpx.AsyncClient(base_url=BASE_URL, transport=_TRANSPORT, timeout=10.0)
+
+# DINO_TEST_CACHE=1 memoizes the parsed JSON of idempotent GETs for the life of
+# the process (handy when calling run_all_tests() repeatedly from a REPL).
+# Off by default so normal and CI runs always see fresh data.
+USE_CACHE = os.environ.get("DINO_TEST_CACHE") == "1"
+
+# orjson instead of httpx's stdlib json for both directions
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+async def _do(method: str, path: str, body: Optional[Dict[str, Any]] = None):
+    """Send one request; returns the parsed JSON body, or None (after reporting why)"""
+    kwargs = {"content": orjson.dumps(body), "headers": _JSON_HEADERS} if body is not None else {}
+    try:
+        response = await CLIENT.request(method, path, **kwargs)
+    except httpx.HTTPError as e:
+        print_error(f"{method} {path} failed: {e}")
+        return None
+    
+    if not response.is_success:
+        print_error(f"{method} {path} failed: {response.status_code} {response.reason_phrase}")
+        return None
+    return orjson.loads(response.content)
+
+# Successful GET bodies by path (only filled when USE_CACHE is on)
+_json_cache: Dict[str, Any] = {}
+
+async def get_json(path: str):
+    """GET a path and return the parsed body or None (cached if DINO_TEST_CACHE=1)"""
+    if USE_CACHE and path in _json_cache:
+        return _json_cache[path]
+    data = await _do("GET", path)
+    if USE_CACHE and data is not None:
+        _json_cache[path] = data
+    return data
+
 class Colors:
     """Terminal colors for output"""
     GREEN = '\033[92m'
@@ -19,193 +80,284 @@ class Colors:
     RESET = '\033[0m'
     BOLD = '\033[1m'
 
+# No escape codes when output is piped (CI logs, files)
+if not sys.stdout.isatty():
+    for _name in ('GREEN', 'RED', 'YELLOW', 'BLUE', 'RESET', 'BOLD'):
+        setattr(Colors, _name, '')
+
+# Output levels; INFO is logging's own
+TEST = 15
+OK = 25
+FAIL = 35
+for _level, _name in ((TEST, "TEST"), (OK, "OK"), (FAIL, "FAIL")):
+    logging.addLevelName(_level, _name)
+
+class ColorFormatter(logging.Formatter):
+    """Prefixes each line for its level (Colors are blank when not a TTY)"""
+    PREFIXES = {
+        TEST: f"\n{Colors.BLUE}{Colors.BOLD}🧪 Testing: ",
+        OK: f"{Colors.GREEN}✅ ",
+        FAIL: f"{Colors.RED}❌ ",
+        logging.INFO: f"{Colors.YELLOW}ℹ️  "
+    }
+    
+    def format(self, record):
+        return self.PREFIXES.get(record.levelno, "") + record.getMessage() + Colors.RESET
+
+# Checks running as concurrent tasks collect their lines here instead of
+# printing, so their output doesn't interleave (each task gets its own copy)
+_output: ContextVar[Optional[List[str]]] = ContextVar("_output", default=None)
+
+def emit_lines(lines: List[str]):
+    """Print formatted lines, or hold them if the current task is buffering"""
+    held = _output.get()
+    if held is None:
+        sys.stdout.write("".join(line + "\n" for line in lines))
+    else:
+        held.extend(lines)
+
+class _TaskHandler(logging.StreamHandler):
+    """Writes to stdout unless the current task is buffering its output"""
+    
+    def emit(self, record):
+        lines = _output.get()
+        if lines is None:
+            super().emit(record)
+        else:
+            lines.append(self.format(record))
+
+async def run_buffered(test, *args):
+    """Run a test holding back its output; returns (result, lines)"""
+    lines = []
+    token = _output.set(lines)
+    try:
+        return await test(*args), lines
+    finally:
+        _output.reset(token)
+
+# LOGLEVEL picks what is shown (DEBUG, TEST, INFO, OK, FAIL, ...). Per-row
+# details and echoed server data only appear at DEBUG, the default when
+# someone is watching a terminal; DINO_TEST_VERBOSE=1/0 overrides that default
+_verbose = os.environ.get("DINO_TEST_VERBOSE", "1" if sys.stdout.isatty() else "0") == "1"
+_handler = _TaskHandler(sys.stdout)
+_handler.setFormatter(ColorFormatter())
+logger = logging.getLogger("dinotest")
+logger.addHandler(_handler)
+logger.setLevel(os.environ.get("LOGLEVEL", "DEBUG" if _verbose else "TEST").upper())
+logger.propagate = False
+
 def print_test(name: str):
     """Print test name"""
-    print(f"\n{Colors.BLUE}{Colors.BOLD}🧪 Testing: {name}{Colors.RESET}")
+    logger.log(TEST, "%s", name)
 
 def print_success(message: str):
     """Print success message"""
-    print(f"{Colors.GREEN}✅ {message}{Colors.RESET}")
+    logger.log(OK, "%s", message)
 
 def print_error(message: str):
     """Print error message"""
-    print(f"{Colors.RED}❌ {message}{Colors.RESET}")
+    logger.log(FAIL, "%s", message)
 
 def print_info(message: str):
     """Print info message"""
-    print(f"{Colors.YELLOW}ℹ️  {message}{Colors.RESET}")
+    logger.info("%s", message)
 
-def test_health_check():
+async def test_health_check():
     """Test the root endpoint"""
     print_test("Health Check")
     
-    try:
-        response = requests.get(f"{BASE_URL}/")
-        response.raise_for_status()
-        
-        data = response.json()
-        print_success(f"API is running: {data['message']}")
-        return True
-    except Exception as e:
-        print_error(f"Health check failed: {e}")
+    data = await get_json("/")
+    if data is None:
         return False
+    
+    print_success(f"API is running: {data['message']}")
+    return True
 
-def test_get_restaurants():
+async def test_get_restaurants():
     """Test getting all restaurants"""
     print_test("Get All Restaurants")
     
-    try:
-        response = requests.get(f"{BASE_URL}/restaurants")
-        response.raise_for_status()
-        
-        restaurants = response.json()
-        print_success(f"Found {len(restaurants)} restaurants")
-        
+    restaurants = await get_json("/restaurants")
+    if restaurants is None:
+        return []
+    
+    print_success(f"Found {len(restaurants)} restaurants")
+    
+    if logger.isEnabledFor(logging.DEBUG):
         for restaurant in restaurants:
             print_info(f"  🦕 {restaurant['name']} - {restaurant['location']}")
-        
-        return restaurants
-    except Exception as e:
-        print_error(f"Failed to get restaurants: {e}")
-        return []
+    
+    return restaurants
 
-def test_get_restaurant_by_id(restaurant_id: int):
+async def test_get_restaurant_by_id(restaurant_id: int):
     """Test getting a specific restaurant"""
     print_test(f"Get Restaurant by ID ({restaurant_id})")
     
-    try:
-        response = requests.get(f"{BASE_URL}/restaurants/{restaurant_id}")
-        response.raise_for_status()
-        
-        restaurant = response.json()
+    restaurant = await get_json(f"/restaurants/{restaurant_id}")
+    if restaurant is not None:
         print_success(f"Retrieved: {restaurant['name']}")
-        return restaurant
-    except Exception as e:
-        print_error(f"Failed to get restaurant: {e}")
-        return None
+    return restaurant
 
-def test_get_tables(restaurant_id: int):
-    """Test getting tables for a restaurant"""
+async def test_get_tables(restaurant_id: int):
+    """Test getting tables for a restaurant; returns (tables, first_available_idx)"""
     print_test(f"Get Tables for Restaurant {restaurant_id}")
     
-    try:
-        response = requests.get(f"{BASE_URL}/restaurants/{restaurant_id}/tables")
-        response.raise_for_status()
-        
-        tables = response.json()
-        reserved = sum(1 for t in tables if t['is_reserved'])
-        available = len(tables) - reserved
-        
-        print_success(f"Found {len(tables)} tables")
+    tables = await get_json(f"/restaurants/{restaurant_id}/tables")
+    if tables is None:
+        return None
+    
+    # Count reserved tables and find the first free one in the same pass
+    reserved = 0
+    first_available_idx = None
+    for i, table in enumerate(tables):
+        if table['is_reserved']:
+            reserved += 1
+        elif first_available_idx is None:
+            first_available_idx = i
+    available = len(tables) - reserved
+    
+    print_success(f"Found {len(tables)} tables")
+    if logger.isEnabledFor(logging.DEBUG):
         print_info(f"  🦕 Available: {available}")
         print_info(f"  🍴 Reserved: {reserved}")
-        
-        return tables
-    except Exception as e:
-        print_error(f"Failed to get tables: {e}")
-        return []
+    
+    return tables, first_available_idx
+
+# Fixed parts of the test reservation; booked for tomorrow at 7 PM
+_RESV_TEMPLATE = {
+    "customer_name": "Test Dino",
+    "phone": "+1-555-TEST-123"
+}
 
-def test_create_reservation(table_id: int, capacity: int):
+@lru_cache(maxsize=1)
+def _resv_time_for_bucket(bucket: int) -> str:
+    """Tomorrow at 7 PM as ISO text; callers pass int(time.time()) so it's rebuilt at most once a second"""
+    t = (datetime.now() + timedelta(days=1)).replace(hour=19, minute=0, second=0, microsecond=0)
+    return t.isoformat()
+
+async def test_create_reservation(table_id: int, capacity: int):
     """Test creating a reservation"""
     print_test("Create Reservation")
     
-    # Create reservation for tomorrow at 7 PM
-    tomorrow = datetime.now() + timedelta(days=1)
-    reservation_time = tomorrow.replace(hour=19, minute=0, second=0, microsecond=0)
-    
-    reservation_data = {
+    reservation = await _do("POST", "/reservations", {
+        **_RESV_TEMPLATE,
         "table_id": table_id,
-        "customer_name": "Test Dino",
-        "phone": "+1-555-TEST-123",
         "party_size": min(2, capacity),
-        "reservation_time": reservation_time.isoformat()
-    }
-    
-    try:
-        response = requests.post(
-            f"{BASE_URL}/reservations",
-            json=reservation_data
-        )
-        response.raise_for_status()
-        
-        reservation = response.json()
+        "reservation_time": _resv_time_for_bucket(int(time.time()))
+    })
+    if reservation is not None:
         print_success(f"Created reservation ID: {reservation['id']}")
-        print_info(f"  Customer: {reservation['customer_name']}")
-        print_info(f"  Time: {reservation['reservation_time']}")
-        
-        return reservation
-    except Exception as e:
-        print_error(f"Failed to create reservation: {e}")
-        return None
+        if logger.isEnabledFor(logging.DEBUG):
+            print_info(f"  Customer: {reservation['customer_name']}")
+            print_info(f"  Time: {reservation['reservation_time']}")
+    return reservation
 
-def test_update_reservation(reservation_id: int):
+async def test_update_reservation(reservation_id: int):
     """Test updating a reservation"""
     print_test(f"Update Reservation {reservation_id}")
     
-    update_data = {
+    reservation = await _do("PUT", f"/reservations/{reservation_id}", {
         "customer_name": "Updated Test Dino",
         "party_size": 3
-    }
-    
-    try:
-        response = requests.put(
-            f"{BASE_URL}/reservations/{reservation_id}",
-            json=update_data
-        )
-        response.raise_for_status()
-        
-        reservation = response.json()
+    })
+    if reservation is not None:
         print_success("Reservation updated successfully")
-        print_info(f"  New name: {reservation['customer_name']}")
-        print_info(f"  New party size: {reservation['party_size']}")
-        
-        return reservation
-    except Exception as e:
-        print_error(f"Failed to update reservation: {e}")
-        return None
+        if logger.isEnabledFor(logging.DEBUG):
+            print_info(f"  New name: {reservation['customer_name']}")
+            print_info(f"  New party size: {reservation['party_size']}")
+    return reservation
 
-def test_get_all_reservations():
-    """Test getting all reservations"""
+# Enough rows to exercise the list endpoint without downloading the whole table
+RESERVATIONS_LIMIT = 100
+
+async def test_get_all_reservations():
+    """Test listing reservations (first RESERVATIONS_LIMIT rows)"""
     print_test("Get All Reservations")
     
-    try:
-        response = requests.get(f"{BASE_URL}/reservations")
-        response.raise_for_status()
-        
-        reservations = response.json()
-        print_success(f"Found {len(reservations)} total reservations")
-        
-        reserved = sum(1 for r in reservations if r['status'] == 'reserved')
-        cancelled = sum(1 for r in reservations if r['status'] == 'cancelled')
-        
-        print_info(f"  ✓ Reserved: {reserved}")
-        print_info(f"  ✗ Cancelled: {cancelled}")
-        
-        return reservations
-    except Exception as e:
-        print_error(f"Failed to get reservations: {e}")
-        return []
+    reservations = await _do("GET", f"/reservations?limit={RESERVATIONS_LIMIT}")
+    if reservations is None:
+        return None
+    
+    if len(reservations) > RESERVATIONS_LIMIT:
+        print_error(f"Asked for at most {RESERVATIONS_LIMIT} reservations, got {len(reservations)}")
+        return None
+    
+    print_success(f"Listed {len(reservations)} reservations")
+    return reservations
 
-def test_cancel_reservation(reservation_id: int):
+async def test_get_reservation_stats():
+    """Test the reservation counts"""
+    print_test("Get Reservation Stats")
+    
+    stats = await _do("GET", "/reservations/stats")
+    if stats is None:
+        return None
+    
+    print_success(f"Found {stats['total']} total reservations")
+    print_info(f"  ✓ Reserved: {stats['reserved']}")
+    print_info(f"  ✗ Cancelled: {stats['cancelled']}")
+    
+    return stats
+
+async def test_cancel_reservation(reservation_id: int):
     """Test cancelling a reservation"""
     print_test(f"Cancel Reservation {reservation_id}")
     
-    try:
-        response = requests.delete(f"{BASE_URL}/reservations/{reservation_id}")
-        response.raise_for_status()
-        
-        result = response.json()
-        print_success(f"Reservation cancelled: {result['message']}")
-        return True
-    except Exception as e:
-        print_error(f"Failed to cancel reservation: {e}")
+    result = await _do("DELETE", f"/reservations/{reservation_id}")
+    if result is None:
         return False
+    
+    print_success(f"Reservation cancelled: {result['message']}")
+    return True
+
+def record(results: Dict[str, int], ok: bool):
+    """Count one test outcome"""
+    results['passed' if ok else 'failed'] += 1
 
-def run_all_tests():
-    """Run all API tests"""
-    print("\n" + "="*70)
-    print(f"{Colors.BOLD}🦕 DINO RESERVE API TESTS 🦖{Colors.RESET}")
-    print("="*70)
+async def _check_restaurant(restaurant_id: int):
+    """Tests 3-7 for one restaurant: get, tables, create -> update -> cancel"""
+    results = {'passed': 0, 'failed': 0}
+    
+    # Tests 3 and 4: Get Restaurant by ID, Get Tables (independent reads)
+    (restaurant, restaurant_lines), (tables_result, tables_lines) = await asyncio.gather(
+        run_buffered(test_get_restaurant_by_id, restaurant_id),
+        run_buffered(test_get_tables, restaurant_id)
+    )
+    emit_lines(restaurant_lines + tables_lines)
+    record(results, restaurant is not None)
+    record(results, tables_result is not None)
+    if tables_result is None:
+        return results
+    
+    tables, first_available_idx = tables_result
+    if first_available_idx is None:
+        print_info("No available tables to test reservation creation")
+        return results
+    
+    # Test 5: Create Reservation
+    available_table = tables[first_available_idx]
+    reservation = await test_create_reservation(
+        available_table['id'],
+        available_table['capacity']
+    )
+    record(results, reservation is not None)
+    if reservation is None:
+        return results
+    
+    # Test 6: Update Reservation
+    record(results, await test_update_reservation(reservation['id']) is not None)
+    
+    # Test 7: Cancel Reservation
+    record(results, await test_cancel_reservation(reservation['id']))
+    return results
+
+async def run_all_tests(restaurant_ids: Optional[Iterable[int]] = None):
+    """Run all API tests (against every restaurant unless restaurant_ids is given)"""
+    sys.stdout.write(
+        "\n" + "="*70 + "\n"
+        f"{Colors.BOLD}🦕 DINO RESERVE API TESTS 🦖{Colors.RESET}\n"
+        + "="*70 + "\n"
+    )
     
     # Track test results
     results = {
@@ -214,7 +366,7 @@ def run_all_tests():
     }
     
     # Test 1: Health Check
-    if test_health_check():
+    if await test_health_check():
         results['passed'] += 1
     else:
         results['failed'] += 1
@@ -222,91 +374,67 @@ def run_all_tests():
         return results
     
     # Test 2: Get Restaurants
-    restaurants = test_get_restaurants()
+    restaurants = await test_get_restaurants()
     if restaurants:
         results['passed'] += 1
     else:
         results['failed'] += 1
         return results
     
-    # Test 3: Get Restaurant by ID
-    if restaurants:
-        restaurant = test_get_restaurant_by_id(restaurants[0]['id'])
-        if restaurant:
-            results['passed'] += 1
-        else:
-            results['failed'] += 1
+    if restaurant_ids is None:
+        restaurant_ids = [r['id'] for r in restaurants]
     
-    # Test 4: Get Tables
-    if restaurants:
-        tables = test_get_tables(restaurants[0]['id'])
-        if tables:
-            results['passed'] += 1
-        else:
-            results['failed'] += 1
-        
-        # Test 5: Create Reservation
-        if tables:
-            # Find an available table
-            available_table = next((t for t in tables if not t['is_reserved']), None)
-            
-            if available_table:
-                reservation = test_create_reservation(
-                    available_table['id'],
-                    available_table['capacity']
-                )
-                
-                if reservation:
-                    results['passed'] += 1
-                    
-                    # Test 6: Update Reservation
-                    updated = test_update_reservation(reservation['id'])
-                    if updated:
-                        results['passed'] += 1
-                    else:
-                        results['failed'] += 1
-                    
-                    # Test 7: Get All Reservations
-                    all_reservations = test_get_all_reservations()
-                    if all_reservations:
-                        results['passed'] += 1
-                    else:
-                        results['failed'] += 1
-                    
-                    # Test 8: Cancel Reservation
-                    if test_cancel_reservation(reservation['id']):
-                        results['passed'] += 1
-                    else:
-                        results['failed'] += 1
-                else:
-                    results['failed'] += 1
-            else:
-                print_info("No available tables to test reservation creation")
-    
-    # Print summary
-    print("\n" + "="*70)
-    print(f"{Colors.BOLD}📊 TEST SUMMARY{Colors.RESET}")
-    print("="*70)
-    print(f"{Colors.GREEN}✅ Passed: {results['passed']}{Colors.RESET}")
-    print(f"{Colors.RED}❌ Failed: {results['failed']}{Colors.RESET}")
+    # Tests 3-7 for every restaurant plus Tests 8 and 9: Get All Reservations
+    # and Get Reservation Stats (not tied to one restaurant), all concurrently;
+    # each task buffers its output
+    reservations_run, stats_run, *restaurant_runs = await asyncio.gather(
+        run_buffered(test_get_all_reservations),
+        run_buffered(test_get_reservation_stats),
+        *(run_buffered(_check_restaurant, rid) for rid in restaurant_ids)
+    )
+    
+    for outcome, lines in (reservations_run, stats_run):
+        emit_lines(lines)
+        record(results, outcome is not None)
+    
+    for restaurant_results, lines in restaurant_runs:
+        emit_lines(lines)
+        for key in results:
+            results[key] += restaurant_results[key]
     
+    # Print summary (one write, one flush)
     total = results['passed'] + results['failed']
     percentage = (results['passed'] / total * 100) if total > 0 else 0
     
-    print(f"\n{Colors.BOLD}Success Rate: {percentage:.1f}%{Colors.RESET}")
+    summary = [
+        "\n" + "="*70,
+        f"{Colors.BOLD}📊 TEST SUMMARY{Colors.RESET}",
+        "="*70,
+        f"{Colors.GREEN}✅ Passed: {results['passed']}{Colors.RESET}",
+        f"{Colors.RED}❌ Failed: {results['failed']}{Colors.RESET}",
+        f"\n{Colors.BOLD}Success Rate: {percentage:.1f}%{Colors.RESET}"
+    ]
     
     if results['failed'] == 0:
-        print(f"\n{Colors.GREEN}{Colors.BOLD}🎉 ALL TESTS PASSED! 🎉{Colors.RESET}")
+        summary.append(f"\n{Colors.GREEN}{Colors.BOLD}🎉 ALL TESTS PASSED! 🎉{Colors.RESET}")
     else:
-        print(f"\n{Colors.YELLOW}⚠️  Some tests failed. Check the output above.{Colors.RESET}")
+        summary.append(f"\n{Colors.YELLOW}⚠️  Some tests failed. Check the output above.{Colors.RESET}")
     
-    print()
+    sys.stdout.write("\n".join(summary) + "\n\n")
+    sys.stdout.flush()
     return results
 
+async def main():
+    """Run the suite, then close the shared client"""
+    try:
+        await run_all_tests()
+    finally:
+        await CLIENT.aclose()
+
 if __name__ == "__main__":
     try:
-        run_all_tests()
+        asyncio.run(main())
     except KeyboardInterrupt:
-        print(f"\n\n{Colors.YELLOW}Tests interrupted by user{Colors.RESET}")
+        print_info("Tests interrupted by user")
     except Exception as e:
-        print(f"\n{Colors.RED}Unexpected error: {e}{Colors.RESET}")
+        print_error(f"Unexpected error: {e}")